@@ -4,6 +4,14 @@ import json
 import time
 import threading
 import asyncio
+import wave
+import mmap
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 import calendar
 import random
@@ -48,7 +56,951 @@ logging.basicConfig(
     ]
 )
 
+DEFAULT_PREFERENCES = {
+    'voice_id': 1,
+    'speech_rate': 180,
+    'volume': 0.9,
+    'energy_threshold': 300,
+    'wake_word': 'jarvis',
+    'language': 'en-US'
+}
+
+class PreferencesStore:
+    """Cached user preferences with debounced atomic writes and change notifications"""
+
+    def __init__(self, path: str = 'preferences.json', defaults: Dict = None,
+                 save_delay: float = 1.0, watch_interval: float = 2.0):
+        self.path = path
+        self.defaults = dict(defaults or DEFAULT_PREFERENCES)
+        self.save_delay = save_delay
+        self.watch_interval = watch_interval
+        self._lock = threading.RLock()
+        self._values = dict(self.defaults)
+        self._subscribers: Dict[Optional[str], List] = {}
+        self._save_timer = None
+        self._mtime = None
+        self._watching = False
+        self.load()
+
+    def load(self) -> Dict:
+        """Load preferences from disk and notify subscribers of any changes"""
+        mtime = None
+        try:
+            if not os.path.exists(self.path):
+                return self.snapshot()
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+            new_values = dict(self.defaults)
+            new_values.update(data)
+        except Exception as e:
+            logging.error(f"Failed to load preferences: {e}")
+            # Don't retry the same bad file on every watch interval
+            self._mtime = mtime
+            return self.snapshot()
+
+        with self._lock:
+            self._mtime = mtime
+            changed = {k: v for k, v in new_values.items() if self._values.get(k) != v}
+            self._values = new_values
+        self._notify(changed)
+        return self.snapshot()
+
+    def snapshot(self) -> Dict:
+        """Return a copy of the current preferences"""
+        with self._lock:
+            return dict(self._values)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._values.get(key, self.defaults.get(key, default))
+
+    def get_int(self, key: str, default: int = 0) -> int:
+        try:
+            return int(self.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float(self, key: str, default: float = 0.0) -> float:
+        try:
+            return float(self.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_str(self, key: str, default: str = "") -> str:
+        value = self.get(key, default)
+        return default if value is None else str(value)
+
+    def set(self, key: str, value: Any):
+        """Update a preference and schedule a save"""
+        self.update({key: value})
+
+    def update(self, values: Dict):
+        """Update several preferences at once and schedule a single save"""
+        with self._lock:
+            changed = {k: v for k, v in values.items() if self._values.get(k) != v}
+            self._values.update(changed)
+        if changed:
+            self._notify(changed)
+            self._schedule_save()
+
+    def subscribe(self, callback, key: str = None):
+        """Register callback(key, value); key=None receives every change"""
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(callback)
+
+    def _notify(self, changed: Dict):
+        if not changed:
+            return
+        with self._lock:
+            listeners = {k: list(v) for k, v in self._subscribers.items()}
+        for key, value in changed.items():
+            for callback in listeners.get(key, []) + listeners.get(None, []):
+                try:
+                    callback(key, value)
+                except Exception as e:
+                    logging.error(f"Preference subscriber error for '{key}': {e}")
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write preferences to disk atomically (write temp file, then rename)"""
+        with self._lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+                self._save_timer = None
+            data = dict(self._values)
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._mtime = os.path.getmtime(self.path)
+            except Exception as e:
+                logging.error(f"Failed to save preferences: {e}")
+
+    def watch(self):
+        """Start a background thread that hot-reloads the file when it changes on disk"""
+        if self._watching:
+            return
+        self._watching = True
+
+        def watch_thread():
+            while self._watching:
+                time.sleep(self.watch_interval)
+                try:
+                    if os.path.exists(self.path) and os.path.getmtime(self.path) != self._mtime:
+                        logging.info("Preferences file changed, reloading")
+                        self.load()
+                except Exception as e:
+                    logging.error(f"Preferences watch error: {e}")
+
+        threading.Thread(target=watch_thread, daemon=True).start()
+
+    def close(self):
+        """Stop watching and write any pending changes"""
+        self._watching = False
+        with self._lock:
+            pending = self._save_timer is not None
+        if pending:
+            self.flush()
+
+class VoiceActivityDetector:
+    """Streaming frame-level voice activity detection for 16-bit mono PCM audio.
+
+    Audio is fed in arbitrary chunks; each completed utterance is returned as a
+    (start_seconds, end_seconds, audio) tuple where audio is a memoryview over
+    the detector's buffer, so no copy is made on hand-off.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 20,
+                 energy_threshold: float = 300.0, noise_ratio: float = 3.0,
+                 zcr_range: tuple = (0.01, 0.5), min_speech_ms: int = 60,
+                 pre_roll_ms: int = 200, trail_pad_ms: int = 200, min_hangover_ms: int = 250,
+                 max_hangover_ms: int = 800, long_utterance_ms: int = 3000,
+                 max_utterance_s: float = 30.0, model=None, model_threshold: float = 0.5):
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.frame_bytes = self.frame_len * 2
+        self.frame_ms = frame_ms
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio
+        self.zcr_range = zcr_range
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.pre_roll_frames = max(1, pre_roll_ms // frame_ms)
+        # Silence kept at the end of an utterance so weak word endings aren't clipped
+        self.trail_pad_frames = trail_pad_ms // frame_ms
+        self.min_hangover_frames = max(1, min_hangover_ms // frame_ms)
+        self.max_hangover_frames = max(self.min_hangover_frames, max_hangover_ms // frame_ms)
+        self.long_utterance_frames = max(1, long_utterance_ms // frame_ms)
+        self.max_utterance_frames = int(max_utterance_s * 1000 / frame_ms)
+        # Optional callable mapping an (n_frames, 2) array of [energy, zcr] to speech probabilities
+        self.model = model
+        self.model_threshold = model_threshold
+        self.noise_floor = 0.0
+        # Completed utterances not yet taken by next_utterance()
+        self.ready = deque()
+        self.reset()
+
+    def reset(self):
+        """Clear partial-frame and in-progress utterance state, keeping the
+        learned noise floor and any completed utterances still queued"""
+        self._remainder = b''
+        self._pre_roll = deque(maxlen=self.pre_roll_frames)
+        self._utterance = None
+        self._utterance_start = 0
+        self._speech_run = 0
+        self._silence_run = 0
+        self._voiced_frames = 0
+        self._utterance_frames = 0
+        self._frame_index = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._utterance is not None
+
+    def frame_features(self, samples: np.ndarray):
+        """Vectorized RMS energy and zero-crossing rate per frame"""
+        frames = samples[:len(samples) - len(samples) % self.frame_len].reshape(-1, self.frame_len)
+        as_float = frames.astype(np.float32)
+        energy = np.sqrt(np.mean(as_float * as_float, axis=1))
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        return energy, zcr
+
+    def classify(self, energy: np.ndarray, zcr: np.ndarray) -> tuple:
+        """Return (onset, continuation) boolean speech masks for a block of frames.
+
+        The ZCR upper bound only gates the start of an utterance; once speech is
+        in progress, high-ZCR unvoiced sounds such as /s/ still count as speech.
+        """
+        threshold = max(self.energy_threshold, self.noise_floor * self.noise_ratio)
+        speech = energy > threshold
+        if self.model is not None:
+            probs = np.asarray(self.model(np.stack([energy, zcr], axis=1)))
+            speech &= probs >= self.model_threshold
+            return speech, speech
+        speech &= zcr >= self.zcr_range[0]
+        return speech & (zcr <= self.zcr_range[1]), speech
+
+    def hangover_frames(self) -> int:
+        """Silence needed to end an utterance; short commands end fast, long dictation waits longer"""
+        progress = min(1.0, self._voiced_frames / self.long_utterance_frames)
+        span = self.max_hangover_frames - self.min_hangover_frames
+        return self.min_hangover_frames + int(span * progress)
+
+    def feed(self, chunk: bytes) -> List[tuple]:
+        """Process a chunk of audio and return any utterances completed by it"""
+        data = self._remainder + bytes(chunk) if self._remainder else bytes(chunk)
+        n_frames = len(data) // self.frame_bytes
+        self._remainder = data[n_frames * self.frame_bytes:]
+        if not n_frames:
+            return []
+
+        view = memoryview(data)
+        samples = np.frombuffer(data, dtype=np.int16, count=n_frames * self.frame_len)
+        energy, zcr = self.frame_features(samples)
+        onset, continuation = self.classify(energy, zcr)
+
+        completed = []
+        for i in range(n_frames):
+            frame = view[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            is_speech = bool(continuation[i] if self._utterance is not None else onset[i])
+            self._frame_index += 1
+
+            if self._utterance is None:
+                self._pre_roll.append(frame)
+                if is_speech:
+                    self._speech_run += 1
+                else:
+                    self._speech_run = 0
+                    self.noise_floor = 0.95 * self.noise_floor + 0.05 * float(energy[i])
+                if self._speech_run >= self.min_speech_frames:
+                    self._start_utterance()
+                continue
+
+            self._utterance += frame
+            self._utterance_frames += 1
+            if is_speech:
+                self._voiced_frames += 1
+                self._silence_run = 0
+            else:
+                self._silence_run += 1
+
+            if self._silence_run >= self.hangover_frames():
+                completed.append(self._end_utterance(trim_frames=max(0, self._silence_run - self.trail_pad_frames)))
+            elif self._utterance_frames >= self.max_utterance_frames:
+                completed.append(self._end_utterance())
+        return completed
+
+    def next_utterance(self, chunk: bytes = b'') -> Optional[tuple]:
+        """Feed a chunk and return the oldest completed utterance; any others stay queued for the next call"""
+        if chunk:
+            self.ready.extend(self.feed(chunk))
+        return self.ready.popleft() if self.ready else None
+
+    def flush(self) -> Optional[tuple]:
+        """End of stream: return the in-progress utterance, if any"""
+        if self._utterance is None:
+            return None
+        return self._end_utterance(trim_frames=max(0, self._silence_run - self.trail_pad_frames))
+
+    def _start_utterance(self):
+        self._utterance = bytearray()
+        for frame in self._pre_roll:
+            self._utterance += frame
+        self._utterance_frames = len(self._pre_roll)
+        self._utterance_start = self._frame_index - self._utterance_frames
+        self._voiced_frames = self._speech_run
+        self._silence_run = 0
+        self._speech_run = 0
+        self._pre_roll.clear()
+
+    def _end_utterance(self, trim_frames: int = 0) -> tuple:
+        frames = self._utterance_frames - trim_frames
+        audio = memoryview(self._utterance)[:frames * self.frame_bytes]
+        frame_s = self.frame_ms / 1000
+        start = self._utterance_start * frame_s
+        result = (start, start + frames * frame_s, audio)
+        # Hand the buffer off to the caller and start a fresh one next time
+        self._utterance = None
+        self._silence_run = 0
+        self._voiced_frames = 0
+        self._utterance_frames = 0
+        return result
+
+    def process_wav(self, path: str, chunk_frames: int = 1024) -> List[tuple]:
+        """Run detection over a recorded 16-bit mono WAV file"""
+        with wave.open(path, 'rb') as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise ValueError("Only 16-bit mono WAV files are supported")
+            if wav.getframerate() != self.sample_rate:
+                raise ValueError(f"Expected {self.sample_rate} Hz audio, got {wav.getframerate()} Hz")
+            self.reset()
+            utterances = []
+            while True:
+                chunk = wav.readframes(chunk_frames)
+                if not chunk:
+                    break
+                utterances.extend(self.feed(chunk))
+            last = self.flush()
+            if last:
+                utterances.append(last)
+        return utterances
+
+class WikipediaLookup:
+    """Wikipedia summaries backed by a persistent SQLite cache and an optional offline abstracts dump.
+
+    The dump is a UTF-8 text file with one "title<TAB>abstract" line per article.
+    build_index() writes a compact sorted hash index next to it so lookups are a
+    binary search over a memory-mapped array followed by one line read.
+    """
+
+    INDEX_MAGIC = b'JWIX0001'
+
+    def __init__(self, conn=None, dump_path: str = None, ttl_days: int = 30, services=None):
+        self.conn = conn
+        self.services = services
+        self.ttl = timedelta(days=ttl_days)
+        self._lock = threading.Lock()
+        self._dump = None
+        self._hashes = None
+        self._offsets = None
+
+        if self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS wiki_titles (
+                    query TEXT PRIMARY KEY,
+                    title TEXT,
+                    options TEXT,
+                    fetched_at TEXT
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS wiki_summaries (
+                    title TEXT,
+                    sentences INTEGER,
+                    summary TEXT,
+                    fetched_at TEXT,
+                    PRIMARY KEY (title, sentences)
+                )
+            ''')
+            self.conn.commit()
+
+        if dump_path:
+            try:
+                self.open_dump(dump_path)
+            except Exception as e:
+                logging.error(f"Wikipedia dump unavailable: {e}")
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().replace('_', ' ').split())
+
+    @staticmethod
+    def title_hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    @classmethod
+    def build_index(cls, dump_path: str, index_path: str = None) -> str:
+        """Build the sorted title-hash index for an abstracts dump"""
+        index_path = index_path or f"{dump_path}.idx"
+        hashes, offsets = [], []
+        with open(dump_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                title = line.split(b'\t', 1)[0].decode('utf-8', 'replace')
+                hashes.append(cls.title_hash(cls.normalize(title)))
+                offsets.append(offset)
+                offset += len(line)
+
+        hashes = np.array(hashes, dtype='<u8')
+        offsets = np.array(offsets, dtype='<u8')
+        order = np.argsort(hashes, kind='stable')
+        with open(index_path, 'wb') as f:
+            f.write(cls.INDEX_MAGIC)
+            f.write(np.array([len(hashes)], dtype='<u8').tobytes())
+            f.write(hashes[order].tobytes())
+            f.write(offsets[order].tobytes())
+        return index_path
+
+    def open_dump(self, dump_path: str, index_path: str = None):
+        """Memory-map an abstracts dump and its index, building the index if needed"""
+        index_path = index_path or f"{dump_path}.idx"
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(dump_path):
+            logging.info("Building Wikipedia dump index")
+            self.build_index(dump_path, index_path)
+
+        with open(index_path, 'rb') as f:
+            if f.read(len(self.INDEX_MAGIC)) != self.INDEX_MAGIC:
+                raise ValueError(f"{index_path} is not a Wikipedia dump index")
+            count = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = len(self.INDEX_MAGIC) + 8
+        self._hashes = np.memmap(index_path, dtype='<u8', mode='r', offset=header, shape=(count,))
+        self._offsets = np.memmap(index_path, dtype='<u8', mode='r', offset=header + count * 8, shape=(count,))
+        with open(dump_path, 'rb') as f:
+            self._dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        logging.info(f"Wikipedia dump loaded with {count} abstracts")
+
+    def offline_lookup(self, topic: str) -> Optional[tuple]:
+        """Return (title, abstract) from the local dump, or None"""
+        if self._dump is None or not len(self._hashes):
+            return None
+        key = self.normalize(topic)
+        h = self.title_hash(key)
+        i = int(np.searchsorted(self._hashes, h))
+        while i < len(self._hashes) and int(self._hashes[i]) == h:
+            start = int(self._offsets[i])
+            end = self._dump.find(b'\n', start)
+            line = self._dump[start:end if end != -1 else len(self._dump)].decode('utf-8', 'replace')
+            title, _, abstract = line.partition('\t')
+            if self.normalize(title) == key:
+                return title, abstract.strip()
+            i += 1
+        return None
+
+    def _cache_get(self, sql: str, params: tuple):
+        if not self.conn:
+            return None
+        with self._lock:
+            row = self.conn.execute(sql, params).fetchone()
+        if row and datetime.now() - datetime.fromisoformat(row[-1]) < self.ttl:
+            return row
+        return None
+
+    def _cache_put(self, sql: str, params: tuple):
+        if not self.conn:
+            return
+        try:
+            with self._lock:
+                self.conn.execute(sql, params)
+                self.conn.commit()
+        except Exception as e:
+            logging.error(f"Wikipedia cache write error: {e}")
+
+    def _remote(self, func, *args, **kwargs):
+        """Network calls go through the service breaker; local dump and cache lookups never do"""
+        if not self.services:
+            return func(*args, **kwargs)
+        return self.services.call(
+            'wikipedia', func, *args,
+            passthrough=(wikipedia.exceptions.DisambiguationError,), **kwargs
+        )
+
+    def resolve_title(self, topic: str) -> tuple:
+        """Resolve a spoken topic to (title, options); options is set for disambiguation pages"""
+        key = self.normalize(topic)
+        row = self._cache_get("SELECT title, options, fetched_at FROM wiki_titles WHERE query = ?", (key,))
+        if row and row[0]:
+            return row[0], json.loads(row[1]) if row[1] else None
+
+        results = self._remote(wikipedia.search, topic, results=1)
+        if not results:
+            # Misses are not cached: an empty result may be transient or a misheard topic
+            return None, None
+        title = results[0]
+        self._cache_put(
+            "INSERT OR REPLACE INTO wiki_titles (query, title, options, fetched_at) VALUES (?, ?, ?, ?)",
+            (key, title, None, datetime.now().isoformat())
+        )
+        return title, None
+
+    def summary(self, topic: str, sentences: int = 2) -> Dict:
+        """Look up a topic; returns a dict with title, summary, options and source"""
+        offline = self.offline_lookup(topic)
+        if offline:
+            title, abstract = offline
+            return {'title': title, 'summary': self.first_sentences(abstract, sentences), 'options': None, 'source': 'dump'}
+
+        title, options = self.resolve_title(topic)
+        if options:
+            return {'title': title, 'summary': None, 'options': options, 'source': 'cache'}
+        if not title:
+            return {'title': None, 'summary': None, 'options': None, 'source': 'wikipedia'}
+
+        row = self._cache_get(
+            "SELECT summary, fetched_at FROM wiki_summaries WHERE title = ? AND sentences = ?",
+            (title, sentences)
+        )
+        if row:
+            return {'title': title, 'summary': row[0], 'options': None, 'source': 'cache'}
+
+        logging.info(f"Fetching Wikipedia summary for '{title}'")
+        try:
+            text = self._remote(wikipedia.summary, title, sentences=sentences, auto_suggest=False)
+        except wikipedia.exceptions.DisambiguationError as e:
+            self._cache_put(
+                "INSERT OR REPLACE INTO wiki_titles (query, title, options, fetched_at) VALUES (?, ?, ?, ?)",
+                (self.normalize(topic), title, json.dumps(e.options[:10]), datetime.now().isoformat())
+            )
+            return {'title': title, 'summary': None, 'options': e.options[:10], 'source': 'wikipedia'}
+
+        self._cache_put(
+            "INSERT OR REPLACE INTO wiki_summaries (title, sentences, summary, fetched_at) VALUES (?, ?, ?, ?)",
+            (title, sentences, text, datetime.now().isoformat())
+        )
+        return {'title': title, 'summary': text, 'options': None, 'source': 'wikipedia'}
+
+    @staticmethod
+    def first_sentences(text: str, sentences: int) -> str:
+        parts = re.split(r'(?<=[.!?])\s+', text)
+        return " ".join(parts[:sentences])
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+        if self._dump is not None:
+            self._dump.close()
+
+class CircuitOpenError(Exception):
+    """Raised when a service call is rejected because its circuit is open"""
+
+class CircuitBreaker:
+    """Per-service circuit breaker: closed -> open after repeated failures -> half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.counts = {'success': 0, 'failure': 0, 'rejected': 0, 'fallback': 0, 'retry': 0, 'hedge': 0}
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open' and time.time() - self.opened_at >= self.reset_timeout:
+                # Let exactly one probe through; everyone else waits for its outcome
+                self.state = 'half_open'
+                self.probing = True
+                return True
+            if self.state != 'closed':
+                self.counts['rejected'] += 1
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.counts['success'] += 1
+            self.failures = 0
+            self.state = 'closed'
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.counts['failure'] += 1
+            self.failures += 1
+            self.probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logging.warning(f"Circuit opened for {self.name}")
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, **self.counts}
+
+class ServiceClient:
+    """Shared call layer for external services with circuit breakers, retry budgets,
+    hedged GETs and last-known-good responses served while a circuit is open"""
+
+    def __init__(self, max_workers: int = 8, retry_ratio: float = 0.2, max_retry_tokens: float = 10.0,
+                 initial_retry_tokens: float = 1.0, backoff: float = 0.2, hedge_delay: float = 0.5):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retry_ratio = retry_ratio
+        self.max_retry_tokens = max_retry_tokens
+        # Start small so the retry ratio limits retries from the first calls on
+        self.initial_retry_tokens = initial_retry_tokens
+        self.backoff = backoff
+        self.hedge_delay = hedge_delay
+        self._retry_tokens: Dict[str, float] = {}
+        self._cache: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='service')
+
+    def breaker(self, service: str) -> CircuitBreaker:
+        with self._lock:
+            if service not in self.breakers:
+                self.breakers[service] = CircuitBreaker(service)
+                self._retry_tokens[service] = self.initial_retry_tokens
+            return self.breakers[service]
+
+    def _spend_retry(self, service: str) -> bool:
+        """Retries are budgeted: each call earns retry_ratio tokens, each retry costs one"""
+        with self._lock:
+            if self._retry_tokens[service] >= 1:
+                self._retry_tokens[service] -= 1
+                return True
+            return False
+
+    def _earn_retry(self, service: str):
+        with self._lock:
+            self._retry_tokens[service] = min(self.max_retry_tokens, self._retry_tokens[service] + self.retry_ratio)
+
+    def _fallback(self, breaker: CircuitBreaker, key: tuple):
+        with self._lock:
+            if key[1] is not None and key in self._cache:
+                breaker.counts['fallback'] += 1
+                return True, self._cache[key]
+        return False, None
+
+    def call(self, service: str, func, *args, cache_key: Any = None, retries: int = 2,
+             hedge: bool = False, passthrough: tuple = (), **kwargs):
+        """Call func through the service's breaker; raises CircuitOpenError or the last error.
+
+        Exceptions listed in passthrough are answers from a healthy service
+        (e.g. a disambiguation page) and are re-raised without counting as failures.
+        """
+        breaker = self.breaker(service)
+        key = (service, cache_key)
+        if not breaker.allow():
+            found, value = self._fallback(breaker, key)
+            if found:
+                return value
+            raise CircuitOpenError(f"{service} is temporarily unavailable")
+
+        self._earn_retry(service)
+        attempt = 0
+        while True:
+            try:
+                result = self._hedged(breaker, func, args, kwargs) if hedge else func(*args, **kwargs)
+            except passthrough:
+                breaker.record_success()
+                raise
+            except Exception as e:
+                logging.error(f"{service} call failed (attempt {attempt + 1}): {e}")
+                # Only fast connection failures are worth retrying in an interactive
+                # turn; a timeout has already cost the user the full wait
+                timed_out = isinstance(e, (requests.exceptions.Timeout, TimeoutError))
+                fast_failure = isinstance(e, (requests.exceptions.ConnectionError, ConnectionError))
+                if fast_failure and not timed_out and attempt < retries and self._spend_retry(service):
+                    breaker.counts['retry'] += 1
+                    time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+                    attempt += 1
+                    continue
+                # One failure per logical call, once retries are used up
+                breaker.record_failure()
+                found, value = self._fallback(breaker, key)
+                if found:
+                    return value
+                raise
+
+            breaker.record_success()
+            if cache_key is not None:
+                with self._lock:
+                    self._cache[key] = result
+            return result
+
+    def _hedged(self, breaker: CircuitBreaker, func, args: tuple, kwargs: Dict):
+        """Issue a second identical request if the first is slow; return the first success"""
+        futures = [self._executor.submit(func, *args, **kwargs)]
+        done, _ = wait(futures, timeout=self.hedge_delay)
+        if not done:
+            breaker.counts['hedge'] += 1
+            futures.append(self._executor.submit(func, *args, **kwargs))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def get(self, service: str, url: str, timeout: float = 5, **kwargs):
+        """Idempotent HTTP GET with hedging; server errors count as failures"""
+        def fetch():
+            response = requests.get(url, timeout=timeout, **kwargs)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            return response
+        return self.call(service, fetch, cache_key=url, hedge=True)
+
+    def stats(self) -> Dict:
+        """Breaker state and counters per service, for monitoring"""
+        with self._lock:
+            breakers = dict(self.breakers)
+            tokens = dict(self._retry_tokens)
+        return {name: {**b.snapshot(), 'retry_tokens': round(tokens[name], 2)} for name, b in breakers.items()}
+
+DEFAULT_DEVICES = {
+    'lights': {'aliases': ['lights', 'light', 'lamp', 'lamps'], 'actions': ['on', 'off', 'dim', 'brighten', 'status'], 'adapter': 'local'},
+    'thermostat': {'aliases': ['thermostat', 'heating', 'heater'], 'actions': ['increase', 'decrease', 'set', 'status'], 'adapter': 'local'},
+    'music': {'aliases': ['music', 'song', 'playlist'], 'actions': ['play', 'pause', 'stop', 'next', 'previous', 'status'], 'adapter': 'local'},
+    'security': {'aliases': ['security', 'alarm'], 'actions': ['arm', 'disarm', 'status'], 'adapter': 'local'}
+}
+
+ACTION_ALIASES = {
+    'up': 'increase', 'raise': 'increase', 'warmer': 'increase',
+    'down': 'decrease', 'lower': 'decrease', 'cooler': 'decrease',
+    'resume': 'play', 'skip': 'next', 'back': 'previous'
+}
+
+# Broad verbs that yield to a more specific action in the same clause ("play the next song")
+GENERIC_ACTIONS = {'play', 'set', 'status'}
+
+class DeviceAdapter(ABC):
+    """Base class for smart home backends; receives batches of (device, action, value) commands"""
+
+    @abstractmethod
+    async def execute_batch(self, commands: List[tuple]) -> List[Dict]:
+        """Execute commands in one round trip and return one result dict per command"""
+
+class SimulatedDeviceHub(DeviceAdapter):
+    """In-process device hub used when no real hardware is configured, and for testing"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.batches = 0
+        self.states = {
+            'lights': {'power': 'off', 'brightness': 100},
+            'thermostat': {'target': 21},
+            'music': {'playback': 'stopped', 'track': 1},
+            'security': {'armed': False}
+        }
+
+    async def execute_batch(self, commands: List[tuple]) -> List[Dict]:
+        # One round trip to the hub per batch, regardless of how many commands it carries
+        await asyncio.sleep(self.latency)
+        self.batches += 1
+        return [self.apply(device, action, value) for device, action, value in commands]
+
+    def apply(self, device: str, action: str, value: Any = None) -> Dict:
+        state = self.states.setdefault(device, {})
+        if action in ('on', 'off'):
+            state['power'] = action
+        elif action in ('dim', 'brighten'):
+            state['power'] = 'on'
+            step = -25 if action == 'dim' else 25
+            state['brightness'] = max(0, min(100, state.get('brightness', 100) + step))
+        elif action in ('increase', 'decrease'):
+            state['target'] = state.get('target', 21) + (1 if action == 'increase' else -1)
+        elif action == 'set' and value is not None:
+            state['target'] = value
+        elif action in ('play', 'pause', 'stop'):
+            state['playback'] = {'play': 'playing', 'pause': 'paused', 'stop': 'stopped'}[action]
+        elif action in ('next', 'previous'):
+            state['track'] = max(1, state.get('track', 1) + (1 if action == 'next' else -1))
+            state['playback'] = 'playing'
+        elif action in ('arm', 'disarm'):
+            state['armed'] = action == 'arm'
+        return {'ok': True, 'state': dict(state)}
+
+class SmartHome:
+    """Device registry, local state cache and batched async dispatch to device adapters"""
+
+    def __init__(self, registry_path: str = 'devices.json', adapters: Dict[str, DeviceAdapter] = None,
+                 batch_window: float = 0.05):
+        self.registry = self.load_registry(registry_path)
+        self.adapters = adapters or {'local': SimulatedDeviceHub()}
+        self.batch_window = batch_window
+        self.state: Dict[str, Dict] = {}
+
+        # Word lookup tables built once so parsing is a single pass over the tokens
+        self.device_words = {}
+        for device, info in self.registry.items():
+            for alias in info.get('aliases', [device]):
+                self.device_words[alias] = device
+        self.action_words = dict(ACTION_ALIASES)
+        for info in self.registry.values():
+            for action in info['actions']:
+                self.action_words[action] = action
+
+        self._pending = []
+        self._flush_handle = None
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+        # Seed the state cache from adapters that can report it
+        for adapter in self.adapters.values():
+            for device, state in getattr(adapter, 'states', {}).items():
+                self.state[device] = dict(state)
+
+    @staticmethod
+    def load_registry(path: str) -> Dict:
+        """Load the device registry from file, falling back to the built-in devices"""
+        try:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logging.error(f"Failed to load device registry: {e}")
+        return DEFAULT_DEVICES
+
+    def has_command(self, query: str) -> bool:
+        """True if the utterance names a device together with an action it supports"""
+        return any(action for _, action, _ in self.parse(query))
+
+    def parse(self, query: str) -> List[tuple]:
+        """Extract (device, action, value) commands from an utterance such as
+        'lights off, thermostat down'. A device with no recognised action gets action None."""
+        commands = []
+        for clause in re.split(r",|;|\band\b|\bthen\b", query):
+            tokens = re.findall(r"[a-z]+|\d+", clause)
+            device = value = None
+            candidates = []
+            for token in tokens:
+                if token.isdigit():
+                    value = int(token)
+                elif token in self.device_words and device is None:
+                    device = self.device_words[token]
+                elif token in self.action_words and self.action_words[token] not in candidates:
+                    candidates.append(self.action_words[token])
+            if device:
+                commands.append((device, self.choose_action(device, candidates, value), value))
+            elif candidates and commands:
+                # "lights on and then off" reuses the previous device, but only
+                # when it supports the action; otherwise the clause isn't ours
+                action = self.choose_action(commands[-1][0], candidates, value)
+                if action:
+                    commands.append((commands[-1][0], action, value))
+        return commands
+
+    def choose_action(self, device: str, candidates: List[str], value: Any) -> Optional[str]:
+        """Pick the most specific action the device supports; None if there is none or it is ambiguous"""
+        supported = [a for a in candidates if a in self.registry[device]['actions']]
+        if value is None and 'set' in supported:
+            supported.remove('set')
+        specific = [a for a in supported if a not in GENERIC_ACTIONS]
+        if len(specific) == 1:
+            return specific[0]
+        if not specific and supported:
+            return supported[0]
+        return None
+
+    def validate(self, device: str, action: str) -> bool:
+        return device in self.registry and action in self.registry[device]['actions']
+
+    def describe(self, device: str) -> str:
+        state = self.state.get(device)
+        if not state:
+            return f"No status available for {device}"
+        details = ", ".join(f"{k} {'yes' if v is True else 'no' if v is False else v}" for k, v in state.items())
+        return f"{device.capitalize()} status: {details}"
+
+    def submit(self, device: str, action: str, value: Any = None):
+        """Queue a command for the next batch; returns a concurrent future for its result"""
+        return asyncio.run_coroutine_threadsafe(self._enqueue(device, action, value), self.loop)
+
+    async def _enqueue(self, device: str, action: str, value: Any) -> Dict:
+        future = self.loop.create_future()
+        self._pending.append(((device, action, value), future))
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(
+                self.batch_window, lambda: self.loop.create_task(self._flush())
+            )
+        return await future
+
+    async def _flush(self):
+        pending, self._pending = self._pending, []
+        self._flush_handle = None
+
+        batches: Dict[str, List] = {}
+        for command, future in pending:
+            adapter = self.registry[command[0]].get('adapter', 'local')
+            batches.setdefault(adapter, []).append((command, future))
+
+        async def run(adapter_name: str, items: List):
+            try:
+                results = await self.adapters[adapter_name].execute_batch([c for c, _ in items])
+            except Exception as e:
+                logging.error(f"Device adapter '{adapter_name}' error: {e}")
+                results = [{'ok': False, 'error': str(e)}] * len(items)
+            for (command, future), result in zip(items, results):
+                if result.get('ok') and 'state' in result:
+                    self.state[command[0]] = result['state']
+                if not future.done():
+                    future.set_result(result)
+
+        await asyncio.gather(*(run(name, items) for name, items in batches.items()))
+
+    def execute(self, commands: List[tuple], timeout: float = 5) -> List[str]:
+        """Run commands, batching everything that arrives together; returns one message per command"""
+        futures = []
+        for device, action, value in commands:
+            if action == 'status' and self.validate(device, action):
+                futures.append(self.describe(device))
+            elif not self.validate(device, action):
+                futures.append(f"Smart home device '{device}' not found or action '{action}' not supported")
+            else:
+                futures.append(self.submit(device, action, value))
+
+        messages = []
+        for (device, action, value), item in zip(commands, futures):
+            if isinstance(item, str):
+                messages.append(item)
+                continue
+            try:
+                result = item.result(timeout=timeout)
+            except Exception as e:
+                logging.error(f"Smart home command error: {e}")
+                result = {'ok': False}
+            if result.get('ok'):
+                messages.append(f"Smart home: {device} {action} command executed")
+            else:
+                messages.append(f"Smart home: {device} {action} failed")
+        return messages
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
 class AdvancedVoiceAssistant:
+    # Intents with no shared state that may run in parallel within one utterance
+    CONCURRENT_INTENTS = {'wikipedia', 'weather', 'news', 'calculate', 'translate', 'smart_home', 'system_info'}
+
     def __init__(self):
         self.name = "JARVIS Pro"
         self.version = "2.0"
@@ -57,13 +1009,16 @@ class AdvancedVoiceAssistant:
         self.conversation_history = []
         self.tasks = []
         self.reminders = []
-        self.user_preferences = self.load_preferences()
+        self.defer_commit = False
+        self.preferences = PreferencesStore('preferences.json', DEFAULT_PREFERENCES)
         
         # Initialize components
         self.init_speech_engine()
         self.init_recognizer()
         self.init_database()
         self.init_apis()
+        self.smart_home = SmartHome()
+        self.intent_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='intent')
         
         # Feature flags
         self.features = {
@@ -81,24 +1036,54 @@ class AdvancedVoiceAssistant:
 
     def init_speech_engine(self):
         """Initialize text-to-speech engine with advanced settings"""
+        self.current_rate = None
+        self.pending_engine_settings = {}
+        self.engine_settings_lock = threading.Lock()
         try:
             self.engine = pyttsx3.init('sapi5')
-            voices = self.engine.getProperty('voices')
             
-            # Set voice preference
-            voice_id = self.user_preferences.get('voice_id', 1)
-            if voices and len(voices) > voice_id:
-                self.engine.setProperty('voice', voices[voice_id].id)
+            # Set voice preference and speech properties
+            self.apply_voice(self.preferences.get_int('voice_id', 1))
+            self.set_speech_rate(self.preferences.get_int('speech_rate', 180))
+            self.engine.setProperty('volume', self.preferences.get_float('volume', 0.9))
             
-            # Set speech properties
-            self.engine.setProperty('rate', self.user_preferences.get('speech_rate', 180))
-            self.engine.setProperty('volume', self.user_preferences.get('volume', 0.9))
+            # Subscribers may run on the preferences watch thread, and pyttsx3 is not
+            # thread-safe: only record the change here, speak() applies it.
+            # The rate is read on every utterance, so it needs no subscription.
+            self.preferences.subscribe(self.queue_engine_setting, 'voice_id')
+            self.preferences.subscribe(self.queue_engine_setting, 'volume')
             
             logging.info("Speech engine initialized")
         except Exception as e:
             logging.error(f"Speech engine initialization failed: {e}")
             self.engine = None
 
+    def queue_engine_setting(self, key: str, value: Any):
+        """Record a changed TTS preference to apply on the next utterance"""
+        with self.engine_settings_lock:
+            self.pending_engine_settings[key] = value
+
+    def apply_pending_engine_settings(self):
+        """Apply queued voice/volume changes; called from speak() on the engine's thread"""
+        with self.engine_settings_lock:
+            pending, self.pending_engine_settings = self.pending_engine_settings, {}
+        if 'voice_id' in pending:
+            self.apply_voice(self.preferences.get_int('voice_id', 1))
+        if 'volume' in pending:
+            self.engine.setProperty('volume', self.preferences.get_float('volume', 0.9))
+
+    def apply_voice(self, voice_id: int):
+        """Select the TTS voice by index"""
+        voices = self.engine.getProperty('voices')
+        if voices and len(voices) > voice_id:
+            self.engine.setProperty('voice', voices[voice_id].id)
+
+    def set_speech_rate(self, rate: int):
+        """Set the TTS rate, skipping the engine call if it is already applied"""
+        if rate != self.current_rate:
+            self.engine.setProperty('rate', rate)
+            self.current_rate = rate
+
     def init_recognizer(self):
         """Initialize speech recognition with advanced settings"""
         self.recognizer = sr.Recognizer()
@@ -109,12 +1094,27 @@ class AdvancedVoiceAssistant:
             self.recognizer.adjust_for_ambient_noise(source, duration=1)
         
         # Set recognition parameters
-        self.recognizer.energy_threshold = self.user_preferences.get('energy_threshold', 300)
-        self.recognizer.dynamic_energy_threshold = True
-        self.recognizer.pause_threshold = 0.8
+        self.recognizer.energy_threshold = self.preferences.get_int('energy_threshold', 300)
+        # Streaming end-of-speech detection on the raw microphone stream
+        self.vad = VoiceActivityDetector(
+            sample_rate=self.microphone.SAMPLE_RATE,
+            energy_threshold=self.recognizer.energy_threshold
+        )
         
         logging.info("Speech recognizer initialized")
 
+    def capture_utterance(self, source, timeout: int = 5):
+        """Read the microphone until the VAD reports a complete utterance"""
+        self.vad.reset()
+        started = time.time()
+        utterance = self.vad.next_utterance()
+        while utterance is None:
+            if not self.vad.in_speech and time.time() - started > timeout:
+                raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+            utterance = self.vad.next_utterance(source.stream.read(source.CHUNK))
+        _, _, audio = utterance
+        return sr.AudioData(audio.tobytes(), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
     def init_database(self):
         """Initialize SQLite database for persistent storage"""
         try:
@@ -154,6 +1154,11 @@ class AdvancedVoiceAssistant:
             ''')
             
             self.conn.commit()
+            
+            # The reminder checker also runs on a background thread; its own
+            # connection keeps its commits out of the main connection's batches
+            self.reminder_conn = self.open_connection()
+            self.reminder_lock = threading.Lock()
             logging.info("Database initialized")
         except Exception as e:
             logging.error(f"Database initialization failed: {e}")
@@ -168,6 +1173,7 @@ class AdvancedVoiceAssistant:
         }
         
         self.translator = Translator()
+        self.services = ServiceClient()
         
         # Initialize Wolfram Alpha client
         try:
@@ -177,32 +1183,22 @@ class AdvancedVoiceAssistant:
                 self.wolfram_client = None
         except:
             self.wolfram_client = None
-
-    def load_preferences(self) -> Dict:
-        """Load user preferences from file"""
-        try:
-            if os.path.exists('preferences.json'):
-                with open('preferences.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            logging.error(f"Failed to load preferences: {e}")
         
-        return {
-            'voice_id': 1,
-            'speech_rate': 180,
-            'volume': 0.9,
-            'energy_threshold': 300,
-            'wake_word': 'jarvis',
-            'language': 'en-US'
-        }
+        # Wikipedia lookups with persistent cache and optional offline abstracts dump
+        self.wikipedia = WikipediaLookup(
+            self.open_connection(),
+            dump_path=self.preferences.get_str('wikipedia_dump') or None,
+            services=self.services
+        )
 
-    def save_preferences(self):
-        """Save user preferences to file"""
+    def open_connection(self):
+        """Open an extra connection to the assistant database for code that runs on
+        other threads, so its commits never land in the main connection's batches"""
         try:
-            with open('preferences.json', 'w') as f:
-                json.dump(self.user_preferences, f, indent=2)
+            return sqlite3.connect(self.db_path, check_same_thread=False)
         except Exception as e:
-            logging.error(f"Failed to save preferences: {e}")
+            logging.error(f"Database connection failed: {e}")
+            return None
 
     def speak(self, text: str, interrupt: bool = False):
         """Advanced text-to-speech with emotion and context"""
@@ -211,13 +1207,15 @@ class AdvancedVoiceAssistant:
             return
         
         try:
+            self.apply_pending_engine_settings()
+            
             # Add personality to responses
             if "error" in text.lower() or "sorry" in text.lower():
-                self.engine.setProperty('rate', 160)
+                self.set_speech_rate(160)
             elif "!" in text or "exciting" in text.lower():
-                self.engine.setProperty('rate', 200)
+                self.set_speech_rate(200)
             else:
-                self.engine.setProperty('rate', self.user_preferences.get('speech_rate', 180))
+                self.set_speech_rate(self.preferences.get_int('speech_rate', 180))
             
             print(f"🤖 {text}")
             self.engine.say(text)
@@ -235,8 +1233,7 @@ class AdvancedVoiceAssistant:
         try:
             with self.microphone as source:
                 print("🎤 Listening...")
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=10)
+                audio = self.capture_utterance(source, timeout=timeout)
             
             print("🔍 Processing speech...")
             
@@ -244,7 +1241,7 @@ class AdvancedVoiceAssistant:
             try:
                 query = self.recognizer.recognize_google(
                     audio, 
-                    language=self.user_preferences.get('language', 'en-US')
+                    language=self.preferences.get_str('language', 'en-US')
                 )
                 print(f"👤 User: {query}")
                 self.log_conversation("User", query)
@@ -282,7 +1279,7 @@ class AdvancedVoiceAssistant:
                     "UPDATE conversations SET assistant_response = ? WHERE id = (SELECT MAX(id) FROM conversations)",
                     (message,)
                 )
-            self.conn.commit()
+            self.commit()
         except Exception as e:
             logging.error(f"Database logging error: {e}")
         
@@ -316,7 +1313,7 @@ class AdvancedVoiceAssistant:
                 break
         
         # Get user's name if available
-        user_name = self.user_preferences.get('user_name', 'Sir')
+        user_name = self.preferences.get_str('user_name', 'Sir')
         
         welcome_msg = f"{greeting}, {user_name}! I'm {self.name}, your advanced AI assistant. How can I help you today?"
         self.speak(welcome_msg)
@@ -326,7 +1323,7 @@ class AdvancedVoiceAssistant:
         try:
             if not city:
                 # Get location automatically
-                g = geocoder.ip('me')
+                g = self.services.call('geocoder', geocoder.ip, 'me', cache_key='me')
                 city = g.city or "London"
             
             api_key = self.api_keys.get('weather')
@@ -334,7 +1331,7 @@ class AdvancedVoiceAssistant:
                 return "Weather service not configured. Please add your OpenWeather API key."
             
             url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-            response = requests.get(url, timeout=5)
+            response = self.services.get('weather', url, timeout=5)
             data = response.json()
             
             if response.status_code == 200:
@@ -358,7 +1355,7 @@ class AdvancedVoiceAssistant:
                 return "News service not configured. Please add your News API key."
             
             url = f"https://newsapi.org/v2/top-headlines?country=us&category={category}&apiKey={api_key}"
-            response = requests.get(url, timeout=5)
+            response = self.services.get('news', url, timeout=5)
             data = response.json()
             
             if response.status_code == 200 and data['articles']:
@@ -390,7 +1387,7 @@ class AdvancedVoiceAssistant:
                     pass
                 return "Advanced calculation service not available"
             
-            res = self.wolfram_client.query(query)
+            res = self.services.call('wolfram', self.wolfram_client.query, query, cache_key=query)
             answer = next(res.results).text
             return f"According to Wolfram Alpha: {answer}"
             
@@ -407,7 +1404,7 @@ class AdvancedVoiceAssistant:
                     "INSERT INTO tasks (task, priority, due_date, created_at) VALUES (?, ?, ?, ?)",
                     (task, priority, due_date, datetime.now().isoformat())
                 )
-                self.conn.commit()
+                self.commit()
                 return f"Task added: {task}"
             
             elif action == "list":
@@ -422,7 +1419,7 @@ class AdvancedVoiceAssistant:
             elif action == "complete":
                 self.cursor.execute("UPDATE tasks SET completed = TRUE WHERE task LIKE ? AND completed = FALSE", (f"%{task}%",))
                 if self.cursor.rowcount > 0:
-                    self.conn.commit()
+                    self.commit()
                     return f"Task completed: {task}"
                 else:
                     return "Task not found"
@@ -451,7 +1448,7 @@ class AdvancedVoiceAssistant:
                 "INSERT INTO reminders (reminder, reminder_time, created_at) VALUES (?, ?, ?)",
                 (reminder_text, reminder_datetime.isoformat(), now.isoformat())
             )
-            self.conn.commit()
+            self.commit()
             
             return f"Reminder set: {reminder_text} at {reminder_datetime.strftime('%Y-%m-%d %H:%M')}"
         
@@ -462,37 +1459,23 @@ class AdvancedVoiceAssistant:
     def check_reminders(self):
         """Check and trigger due reminders"""
         try:
-            now = datetime.now().isoformat()
-            self.cursor.execute(
-                "SELECT id, reminder FROM reminders WHERE reminder_time <= ? AND triggered = FALSE",
-                (now,)
-            )
-            due_reminders = self.cursor.fetchall()
-            
-            for reminder_id, reminder_text in due_reminders:
-                self.speak(f"Reminder: {reminder_text}")
-                self.cursor.execute("UPDATE reminders SET triggered = TRUE WHERE id = ?", (reminder_id,))
-            
-            if due_reminders:
-                self.conn.commit()
+            with self.reminder_lock:
+                now = datetime.now().isoformat()
+                due_reminders = self.reminder_conn.execute(
+                    "SELECT id, reminder FROM reminders WHERE reminder_time <= ? AND triggered = FALSE",
+                    (now,)
+                ).fetchall()
+                
+                for reminder_id, reminder_text in due_reminders:
+                    self.speak(f"Reminder: {reminder_text}")
+                    self.reminder_conn.execute("UPDATE reminders SET triggered = TRUE WHERE id = ?", (reminder_id,))
+                
+                if due_reminders:
+                    self.reminder_conn.commit()
         
         except Exception as e:
             logging.error(f"Reminder check error: {e}")
 
-    def smart_home_control(self, device: str, action: str) -> str:
-        """Smart home device control simulation"""
-        devices = {
-            'lights': ['on', 'off', 'dim', 'brighten'],
-            'thermostat': ['increase', 'decrease', 'set'],
-            'music': ['play', 'pause', 'stop', 'next', 'previous'],
-            'security': ['arm', 'disarm', 'status']
-        }
-        
-        if device in devices and action in devices[device]:
-            return f"Smart home: {device} {action} command executed"
-        else:
-            return f"Smart home device '{device}' not found or action '{action}' not supported"
-
     def take_screenshot(self) -> str:
         """Take and save screenshot"""
         try:
@@ -507,7 +1490,10 @@ class AdvancedVoiceAssistant:
     def translate_text(self, text: str, target_lang: str = 'es') -> str:
         """Translate text to different languages"""
         try:
-            translation = self.translator.translate(text, dest=target_lang)
+            translation = self.services.call(
+                'translate', self.translator.translate, text, dest=target_lang,
+                cache_key=(text, target_lang)
+            )
             return f"Translation ({target_lang}): {translation.text}"
         except Exception as e:
             logging.error(f"Translation error: {e}")
@@ -525,6 +1511,104 @@ class AdvancedVoiceAssistant:
             logging.error(f"System info error: {e}")
             return "Couldn't get system information"
 
+    def service_status(self) -> str:
+        """Summarize external service circuit breaker state"""
+        stats = self.services.stats()
+        logging.info(f"Service stats: {json.dumps(stats)}")
+        if not stats:
+            return "No external services have been used yet"
+        unhealthy = [name for name, info in stats.items() if info['state'] != 'closed']
+        if unhealthy:
+            return f"Services currently degraded: {', '.join(unhealthy)}. All others are healthy."
+        return f"All {len(stats)} external services are healthy"
+
+    def classify_intent(self, query: str) -> str:
+        """Map a single command to the name of the handler that will answer it"""
+        if 'wikipedia' in query:
+            return 'wikipedia'
+        elif any(word in query for word in ['weather', 'temperature', 'forecast']):
+            return 'weather'
+        elif 'news' in query:
+            return 'news'
+        elif any(word in query for word in ['calculate', 'compute', 'math', '+', '-', '*', '/', '=']):
+            return 'calculate'
+        elif 'time' in query:
+            return 'time'
+        elif 'date' in query:
+            return 'date'
+        elif 'task' in query or 'todo' in query:
+            return 'task'
+        elif 'remind' in query:
+            return 'remind'
+        elif 'open' in query:
+            return 'open'
+        elif 'open code' in query or 'visual studio' in query:
+            return 'vscode'
+        elif 'open notepad' in query:
+            return 'notepad'
+        elif 'screenshot' in query or 'capture screen' in query:
+            return 'screenshot'
+        elif 'translate' in query:
+            return 'translate'
+        elif self.smart_home.has_command(query):
+            return 'smart_home'
+        elif 'service' in query and 'status' in query:
+            return 'service_status'
+        elif 'system' in query and 'info' in query:
+            return 'system_info'
+        elif 'email' in query or 'send mail' in query:
+            return 'email'
+        elif 'joke' in query:
+            return 'joke'
+        elif any(word in query for word in ['exit', 'quit', 'goodbye', 'bye', 'stop']):
+            return 'exit'
+        return 'unknown'
+
+    def split_intents(self, query: str) -> List[tuple]:
+        """Split a compound utterance into (text, intent) parts.
+
+        Fragments without a recognised intent are glued back onto their
+        neighbour, so "translate salt and pepper to french" stays one command,
+        and consecutive smart home fragments stay together so they are batched.
+        """
+        pieces = re.split(r'(\s*,\s*|\s+and\s+|\s+then\s+|\s+also\s+)', query)
+        parts = []
+        separator = ''
+        for i, piece in enumerate(pieces):
+            if i % 2:
+                separator = piece
+                continue
+            intent = self.classify_intent(piece)
+            if intent == 'unknown':
+                intent = None
+            if parts and (intent is None or (intent == 'smart_home' and parts[-1][1] == 'smart_home')):
+                parts[-1][0] += separator + piece
+            elif parts and parts[-1][1] is None:
+                parts[-1][0] += separator + piece
+                parts[-1][1] = intent
+            else:
+                parts.append([piece, intent])
+        if len(parts) < 2:
+            return [(query, self.classify_intent(query))]
+        return [(text.strip(), intent) for text, intent in parts]
+
+    @contextmanager
+    def batched_writes(self):
+        """Defer database commits inside the block and commit once at the end"""
+        self.defer_commit = True
+        try:
+            yield
+        except Exception:
+            self.defer_commit = False
+            self.conn.rollback()
+            raise
+        self.defer_commit = False
+        self.commit()
+
+    def commit(self):
+        if not self.defer_commit:
+            self.conn.commit()
+
     def process_command(self, query: str) -> str:
         """Advanced command processing with AI-like understanding"""
         query = query.lower().strip()
@@ -532,30 +1616,74 @@ class AdvancedVoiceAssistant:
         # Check reminders first
         self.check_reminders()
         
+        parts = self.split_intents(query)
+        if len(parts) == 1:
+            return self.handle_command(*parts[0])
+        
+        # Independent network-bound intents run concurrently; the rest run in
+        # order on this thread with their database writes in one transaction
+        responses = [None] * len(parts)
+        futures = {}
+        for i, (text, intent) in enumerate(parts):
+            if intent in self.CONCURRENT_INTENTS:
+                futures[i] = self.intent_executor.submit(self.handle_command, text, intent)
+        
+        with self.batched_writes():
+            for i, (text, intent) in enumerate(parts):
+                if i not in futures:
+                    responses[i] = self.handle_command(text, intent)
+        
+        for i, future in futures.items():
+            try:
+                responses[i] = future.result()
+            except Exception as e:
+                logging.error(f"Intent '{parts[i][1]}' failed: {e}")
+                responses[i] = "Sorry, part of that request failed"
+        
+        replies = []
+        for response in responses:
+            if not response or response == "QUIT":
+                continue
+            response = response.strip()
+            replies.append(response if response[-1] in '.!?' else response + '.')
+        
+        # "Turn off the lights and goodbye": answer the rest, then end the session
+        if "QUIT" in responses:
+            if replies:
+                self.speak(" ".join(replies))
+            return "QUIT"
+        return " ".join(replies)
+
+    def handle_command(self, query: str, intent: str = None) -> str:
+        """Run the handler for a single command"""
+        intent = intent or self.classify_intent(query)
+        
         # Wikipedia search
-        if 'wikipedia' in query:
+        if intent == 'wikipedia':
             try:
                 topic = query.replace('wikipedia', '').replace('search', '').strip()
                 if topic:
-                    self.speak('Searching Wikipedia...')
-                    result = wikipedia.summary(topic, sentences=2)
-                    return f"According to Wikipedia: {result}"
+                    result = self.wikipedia.summary(topic, sentences=2)
+                    if result['options']:
+                        return f"Multiple results found. Please be more specific. Options: {', '.join(result['options'][:3])}"
+                    if not result['summary']:
+                        return f"I couldn't find anything on Wikipedia about {topic}"
+                    return f"According to Wikipedia: {result['summary']}"
                 else:
                     return "What would you like me to search on Wikipedia?"
-            except wikipedia.exceptions.DisambiguationError as e:
-                return f"Multiple results found. Please be more specific. Options: {', '.join(e.options[:3])}"
             except Exception as e:
+                logging.error(f"Wikipedia error: {e}")
                 return "Wikipedia search failed"
         
         # Weather
-        elif any(word in query for word in ['weather', 'temperature', 'forecast']):
+        elif intent == 'weather':
             city = None
             if ' in ' in query:
                 city = query.split(' in ')[-1].strip()
             return self.get_weather(city)
         
         # News
-        elif 'news' in query:
+        elif intent == 'news':
             category = "general"
             if 'tech' in query: category = "technology"
             elif 'sport' in query: category = "sports"
@@ -563,21 +1691,21 @@ class AdvancedVoiceAssistant:
             return self.get_news(category)
         
         # Calculations
-        elif any(word in query for word in ['calculate', 'compute', 'math', '+', '-', '*', '/', '=']):
+        elif intent == 'calculate':
             return self.calculate_advanced(query)
         
         # Time
-        elif 'time' in query:
+        elif intent == 'time':
             current_time = datetime.now().strftime("%I:%M %p")
             return f"The current time is {current_time}"
         
         # Date
-        elif 'date' in query:
+        elif intent == 'date':
             current_date = datetime.now().strftime("%A, %B %d, %Y")
             return f"Today is {current_date}"
         
         # Task management
-        elif 'task' in query or 'todo' in query:
+        elif intent == 'task':
             if 'add' in query or 'create' in query:
                 task_text = query.replace('add task', '').replace('create task', '').strip()
                 return self.manage_tasks("add", task_text)
@@ -588,7 +1716,7 @@ class AdvancedVoiceAssistant:
                 return self.manage_tasks("complete", task_text)
         
         # Reminders
-        elif 'remind' in query:
+        elif intent == 'remind':
             if 'in' in query:
                 parts = query.split(' in ')
                 reminder_text = parts[0].replace('remind me to', '').replace('remind me', '').strip()
@@ -598,7 +1726,7 @@ class AdvancedVoiceAssistant:
                 return "Please specify when you'd like to be reminded"
         
         # Web browsing
-        elif 'open' in query:
+        elif intent == 'open':
             sites = {
                 'youtube': 'https://youtube.com',
                 'google': 'https://google.com',
@@ -626,14 +1754,14 @@ class AdvancedVoiceAssistant:
                     return f"Opening {site}"
         
         # Applications
-        elif 'open code' in query or 'visual studio' in query:
+        elif intent == 'vscode':
             try:
                 subprocess.Popen(['code'])
                 return "Opening Visual Studio Code"
             except:
                 return "Visual Studio Code not found"
         
-        elif 'open notepad' in query:
+        elif intent == 'notepad':
             try:
                 subprocess.Popen(['notepad.exe'])
                 return "Opening Notepad"
@@ -641,21 +1769,21 @@ class AdvancedVoiceAssistant:
                 return "Notepad not found"
         
         # Smart home
-        elif any(word in query for word in ['lights', 'thermostat', 'music', 'security']):
-            for device in ['lights', 'thermostat', 'music', 'security']:
-                if device in query:
-                    actions = ['on', 'off', 'play', 'pause', 'arm', 'disarm', 'increase', 'decrease']
-                    for action in actions:
-                        if action in query:
-                            return self.smart_home_control(device, action)
-                    return f"What would you like me to do with the {device}?"
+        elif intent == 'smart_home':
+            commands = self.smart_home.parse(query)
+            ready = [command for command in commands if command[1]]
+            messages = self.smart_home.execute(ready) if ready else []
+            for device, action, _ in commands:
+                if action is None:
+                    messages.append(f"What would you like me to do with the {device}?")
+            return ". ".join(messages)
         
         # Screenshot
-        elif 'screenshot' in query or 'capture screen' in query:
+        elif intent == 'screenshot':
             return self.take_screenshot()
         
         # Translation
-        elif 'translate' in query:
+        elif intent == 'translate':
             if ' to ' in query:
                 parts = query.split(' to ')
                 text_to_translate = parts[0].replace('translate', '').strip()
@@ -668,16 +1796,20 @@ class AdvancedVoiceAssistant:
             else:
                 return "Please specify what to translate and to which language"
         
+        # Service health
+        elif intent == 'service_status':
+            return self.service_status()
+        
         # System information
-        elif 'system' in query and 'info' in query:
+        elif intent == 'system_info':
             return self.system_info()
         
         # Email
-        elif 'email' in query or 'send mail' in query:
+        elif intent == 'email':
             return "Email functionality requires configuration. Please set up your email credentials."
         
         # Jokes
-        elif 'joke' in query:
+        elif intent == 'joke':
             jokes = [
                 "Why don't scientists trust atoms? Because they make up everything!",
                 "I told my wife she was drawing her eyebrows too high. She looked surprised.",
@@ -687,7 +1819,7 @@ class AdvancedVoiceAssistant:
             return random.choice(jokes)
         
         # Exit commands
-        elif any(word in query for word in ['exit', 'quit', 'goodbye', 'bye', 'stop']):
+        elif intent == 'exit':
             return "QUIT"
         
         # Default response with learning capability
@@ -719,6 +1851,7 @@ class AdvancedVoiceAssistant:
         print("=" * 50)
         
         self.wish_user()
+        self.preferences.watch()
         
         # Background reminder checker
         def reminder_thread():
@@ -745,7 +1878,7 @@ class AdvancedVoiceAssistant:
                 consecutive_failures = 0
                 
                 # Process wake word
-                wake_word = self.user_preferences.get('wake_word', 'jarvis')
+                wake_word = self.preferences.get_str('wake_word', 'jarvis')
                 if wake_word in query:
                     query = query.replace(wake_word, '').strip()
                     if not query:
@@ -771,7 +1904,10 @@ class AdvancedVoiceAssistant:
         # Cleanup
         try:
             self.conn.close()
-            self.save_preferences()
+            self.reminder_conn.close()
+            self.preferences.close()
+            self.smart_home.close()
+            self.wikipedia.close()
         except:
             pass
         